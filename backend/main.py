@@ -1,14 +1,29 @@
+import asyncio
+import hashlib
+import json
+import logging
 import os
+import string
+import threading
+import time
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import lru_cache
 from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Body, Depends, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, EmailStr, ValidationError
+from cachetools import TTLCache
+import orjson
 
 import firebase_admin
-from firebase_admin import credentials, auth, firestore
+from google.api_core.exceptions import NotFound
+from google.cloud.firestore_v1.base_query import FieldFilter
+from firebase_admin import credentials, auth, firestore, firestore_async
 
 import smtplib
 from email.mime.text import MIMEText
@@ -18,20 +33,153 @@ from dotenv import load_dotenv
 # Always load backend/.env no matter where uvicorn runs from
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 
+# Configure only the app's own logger; the root logger belongs to uvicorn / the embedding process
+logger = logging.getLogger("ccomp")
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+
+# Prefer the service account JSON inline (no key file on disk); fall back to a file path
+cred_json = os.getenv("FIREBASE_SA_JSON")
 cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
-if not cred_path:
-    raise RuntimeError("❌ GOOGLE_APPLICATION_CREDENTIALS not set in .env")
+if cred_json:
+    cred = credentials.Certificate(json.loads(cred_json))
+else:
+    if not cred_path:
+        raise RuntimeError("❌ Neither FIREBASE_SA_JSON nor GOOGLE_APPLICATION_CREDENTIALS set in .env")
 
-if not os.path.exists(cred_path):
-    raise FileNotFoundError(f"❌ Firebase credentials file not found: {cred_path}")
+    if not os.path.exists(cred_path):
+        raise FileNotFoundError(f"❌ Firebase credentials file not found: {cred_path}")
 
-cred = credentials.Certificate(cred_path)
+    cred = credentials.Certificate(cred_path)
 firebase_admin.initialize_app(cred)
-db = firestore.client()
-
+db = firestore_async.client()
+
+MAX_BATCH_WRITES = 500  # Firestore's per-commit write limit
+
+def is_doc_id(value: str) -> bool:
+    """Whether a client-supplied string can be used as a single Firestore document ID"""
+    return bool(value) and "/" not in value and value not in (".", "..")
+
+@lru_cache(maxsize=1024)
+def repos_col(admin_uid: str):
+    return db.collection("admins").document(admin_uid).collection("repositories")
+
+@lru_cache(maxsize=1024)
+def sessions_col(admin_uid: str):
+    return db.collection("admins").document(admin_uid).collection("onboarding_sessions")
+
+# onboarding_tokens/{token} -> {adminUid, sessionId}, so a token resolves without scanning admins
+tokens_col = db.collection("onboarding_tokens")
+
+# A session doesn't change while it is pending, so token -> (admin_uid, session dict) is cached until signup
+_pending_sessions = TTLCache(maxsize=10_000, ttl=3600)
+
+async def find_session(token: str):
+    """Resolve an onboarding token to (admin_uid, session ref, session dict), or Nones if unknown"""
+    if not is_doc_id(token):
+        return None, None, None
+    cached = _pending_sessions.get(token)
+    if cached:
+        admin_uid, session = cached
+        return admin_uid, sessions_col(admin_uid).document(token), session
+
+    # Sessions from before the index need POST /debug/migrate-onboarding-tokens (see README)
+    idx = await tokens_col.document(token).get()
+    if not idx.exists:
+        return None, None, None
+    admin_uid = idx.get("adminUid")
+    ref = sessions_col(admin_uid).document(idx.get("sessionId"))
+    snap = await ref.get()
+    if not snap.exists:
+        return None, None, None
+    session = snap.to_dict()
+    if session.get("status") == "pending":
+        _pending_sessions[token] = (admin_uid, session)
+    return admin_uid, ref, session
+
+# users_by_email/{sha256(lowercased email)} -> {uid}, written alongside each users/{uid} doc
+users_by_email_col = db.collection("users_by_email")
+
+def email_key(email: str) -> str:
+    return hashlib.sha256(email.strip().lower().encode()).hexdigest()
+
+async def uid_for_email(email: str) -> Optional[str]:
+    """Look up a user's uid by email with one point read instead of a users collection scan"""
+    doc = await users_by_email_col.document(email_key(email)).get()
+    return doc.get("uid") if doc.exists else None
+
+# Repo IDs already confirmed to exist, keyed by admin uid
+_repo_ids_cache = TTLCache(maxsize=1024, ttl=60)
+
+# Short-lived read-through caches for polled endpoints
+_repos_page_cache = TTLCache(maxsize=10_000, ttl=10)  # (admin_uid, limit, cursor) -> page
+_session_cache = TTLCache(maxsize=10_000, ttl=10)  # token -> (encoded onboarding payload, ETag)
+_admin_info_cache = TTLCache(maxsize=1024, ttl=600)  # admin uid -> users/{uid} fields
+_inflight = {}
+
+async def cached_read(cache, key, fetch):
+    """Return cache[key], calling fetch() on a miss; concurrent misses on one key share a single in-flight fetch"""
+    if key in cache:
+        return cache[key]
+    flight_key = (id(cache), key)
+    task = _inflight.get(flight_key)
+    if task is None:
+        async def fill():
+            value = await fetch()
+            # Only fills that weren't invalidated mid-flight may populate the cache
+            if _inflight.get(flight_key) is asyncio.current_task():
+                cache[key] = value
+            return value
+
+        def done(t):
+            if _inflight.get(flight_key) is t:
+                del _inflight[flight_key]
+            if not t.cancelled():
+                t.exception()  # mark retrieved; callers re-raise it from the shield
+
+        task = asyncio.ensure_future(fill())
+        _inflight[flight_key] = task
+        task.add_done_callback(done)
+    # Shield so one caller disconnecting doesn't cancel the fetch the others are waiting on
+    return await asyncio.shield(task)
+
+def invalidate(cache, match):
+    """Drop entries of cache whose key satisfies match, and detach in-flight fills for them.
+
+    A detached fill still answers the callers already waiting on it, but no longer writes its
+    (possibly pre-write) value into the cache, and new callers start a fresh fetch.
+    """
+    for key in [k for k in list(cache.keys()) if match(k)]:
+        cache.pop(key, None)
+    for flight_key in [fk for fk in _inflight if fk[0] == id(cache) and match(fk[1])]:
+        del _inflight[flight_key]
+
+async def get_admin_info(uid: str) -> dict:
+    """users/{uid} for an admin; names change rarely, so this is cached for 10 minutes"""
+    async def load():
+        admin_user = await db.collection("users").document(uid).get()
+        return admin_user.to_dict() if admin_user.exists else {}
+    return await cached_read(_admin_info_cache, uid, load)
+
+def invalidate_repos(admin_uid: str):
+    _repo_ids_cache.pop(admin_uid, None)
+    invalidate(_repos_page_cache, lambda key: key[0] == admin_uid)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the Firestore channel (TLS + auth) before the first real request has to pay for it"""
+    try:
+        await db.collection("_warm").document("_warm").get()
+    except Exception:
+        logger.warning("Firestore warm-up failed; first request will open the channel", exc_info=True)
+    yield
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # allow frontend in dev
@@ -43,12 +191,16 @@ app.add_middleware(
 # ---------- Models ----------
 
 class SignupRequest(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, frozen=True)
+
     uid: str
     name: str
     email: str
     role: str = "admin"
 
 class Repository(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     id: str
     name: str
     url: str
@@ -59,6 +211,8 @@ class Repository(BaseModel):
     adminUid: str
 
 class CreateRepositoryRequest(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, frozen=True)
+
     name: str
     url: str
     description: str
@@ -66,6 +220,8 @@ class CreateRepositoryRequest(BaseModel):
     adminUid: str
 
 class OnboardingSession(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     id: str
     email: EmailStr
     role: str
@@ -79,6 +235,8 @@ class OnboardingSession(BaseModel):
     adminUid: str
 
 class CreateOnboardingRequest(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, frozen=True)
+
     email: EmailStr
     role: str
     repositories: List[str]  # repo IDs
@@ -87,11 +245,74 @@ class CreateOnboardingRequest(BaseModel):
     adminUid: str
 
 class EmployeeSignupRequest(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, frozen=True)
+
     uid: str
     name: str
     email: str
     onboarding_token: str
 
+# Response models: FastAPI validates against these and serializes them straight to JSON in pydantic-core
+
+class MessageResponse(BaseModel):
+    message: str
+
+class RepositorySummary(BaseModel):
+    id: str
+    name: str
+    url: str
+    description: str
+    language: str
+    lastSync: datetime
+    status: str
+
+class RepositoryPage(BaseModel):
+    items: List[RepositorySummary]
+    next_cursor: Optional[str] = None
+
+class OnboardingSessionSummary(BaseModel):
+    id: str
+    email: str
+    role: str
+    repositories: List[str]
+    status: str
+    progress: int
+    createdAt: datetime
+    completedAt: Optional[datetime] = None
+
+class OnboardingSessionPage(BaseModel):
+    items: List[OnboardingSessionSummary]
+    next_cursor: Optional[str] = None
+
+class SignupSession(BaseModel):
+    id: str
+    role: str
+    repositories: List[str]
+    customInstructions: Optional[str] = None
+    userLevel: str = "beginner"
+
+class EmployeeSignupResponse(BaseModel):
+    message: str
+    session: SignupSession
+
+def json_body(model):
+    """Dependency that validates the raw request bytes in one pass with model_validate_json"""
+    async def parse(request: Request):
+        try:
+            return model.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+            )
+    return parse
+
+def json_body_schema(model):
+    """openapi_extra for a route using json_body(model), since FastAPI can't see a body read by a dependency"""
+    return {"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": model.model_json_schema()}},
+    }}
+
 # ---------- Email ----------
 
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
@@ -100,64 +321,168 @@ EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 FROM_EMAIL = os.getenv("FROM_EMAIL", EMAIL_USER)
 
-def send_onboarding_email(to_email: str, onboarding_link: str, role: str, admin_name: str):
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = FROM_EMAIL
-        msg['To'] = to_email
-        msg['Subject'] = "Welcome to the Team! Complete Your Account Setup"
+class SMTPPool:
+    """One long-lived SMTP connection, reopened when it has sat idle too long or the server dropped it"""
 
-        html_body = f"""
+    def __init__(self, max_idle: float = 100):
+        self._server = None
+        self._last_used = 0.0
+        self._max_idle = max_idle
+        self._lock = threading.Lock()  # sends run on threadpool workers
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+        server.starttls()
+        server.login(EMAIL_USER, EMAIL_PASSWORD)
+        return server
+
+    def _close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+    def _alive(self) -> bool:
+        if self._server is None or time.monotonic() - self._last_used > self._max_idle:
+            return False
+        try:
+            return self._server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, to_email: str, message: str):
+        with self._lock:
+            if not self._alive():
+                self._close()
+                self._server = self._connect()
+            try:
+                self._server.sendmail(FROM_EMAIL, to_email, message)
+            except smtplib.SMTPServerDisconnected:
+                # Dropped between the probe and the send; retry once on a fresh connection
+                self._server = self._connect()
+                self._server.sendmail(FROM_EMAIL, to_email, message)
+            self._last_used = time.monotonic()
+
+smtp_pool = SMTPPool()
+
+ONBOARDING_SUBJECT = "Welcome to the Team! Complete Your Account Setup"
+ONBOARDING_TEMPLATE = string.Template("""
         <html>
         <body>
             <h2>🎉 Welcome to the Team!</h2>
-            <p>Your admin <b>{admin_name}</b> invited you as <b>{role}</b>.</p>
+            <p>Your admin <b>$admin_name</b> invited you as <b>$role</b>.</p>
             <p>Click below to create your account:</p>
-            <a href="{onboarding_link}" style="padding:10px 20px;background:#0e639c;color:white;border-radius:6px;text-decoration:none;">🚀 Start Onboarding</a>
+            <a href="$onboarding_link" style="padding:10px 20px;background:#0e639c;color:white;border-radius:6px;text-decoration:none;">🚀 Start Onboarding</a>
         </body>
         </html>
-        """
-        msg.attach(MIMEText(html_body, "html"))
+        """)
 
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        server.sendmail(FROM_EMAIL, to_email, msg.as_string())
-        server.quit()
-        print(f"✅ Email sent to {to_email}")
+def send_onboarding_email(to_email: str, onboarding_link: str, role: str, admin_name: str):
+    try:
+        msg = MIMEMultipart()
+        msg['From'] = FROM_EMAIL
+        msg['To'] = to_email
+        msg['Subject'] = ONBOARDING_SUBJECT
+
+        html_body = ONBOARDING_TEMPLATE.substitute(
+            admin_name=admin_name, role=role, onboarding_link=onboarding_link
+        )
+        msg.attach(MIMEText(html_body, "html", _charset="utf-8"))
+
+        smtp_pool.send(to_email, msg.as_string())
+        logger.info("✅ Email sent to %s", to_email)
         return True
-    except Exception as e:
-        print("❌ Email failed:", e)
+    except Exception:
+        logger.exception("❌ Email failed")
         return False
 
+# ---------- Pagination ----------
+
+# Fields the admin dashboard list views render; heavier fields stay on the detail endpoints
+REPO_LIST_FIELDS = ["name", "url", "description", "language", "lastSync", "status"]
+SESSION_LIST_FIELDS = ["email", "role", "repositories", "status", "progress", "createdAt", "completedAt"]
+
+async def fetch_page(col_ref, order_field: str, limit: int, cursor: Optional[str], fields: List[str]):
+    """Read one page of col_ref ordered by order_field; cursor is the last doc ID of the previous page"""
+    query = col_ref.select(fields).order_by(order_field).limit(limit)
+    if cursor:
+        if not is_doc_id(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        cursor_doc = await col_ref.document(cursor).get()
+        if not cursor_doc.exists:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.start_after(cursor_doc)
+
+    items = [{**doc.to_dict(), "id": doc.id} async for doc in query.stream()]
+
+    next_cursor = items[-1]["id"] if len(items) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+def wants_ndjson(request: Request) -> bool:
+    return "application/x-ndjson" in request.headers.get("accept", "")
+
+def datetime_default(obj):
+    # Firestore timestamps are DatetimeWithNanoseconds, a datetime subclass orjson refuses to encode
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError
+
+def stream_ndjson(query):
+    """Stream every doc of query as NDJSON, writing each line as soon as Firestore yields it"""
+    async def lines():
+        async for doc in query.stream():
+            yield orjson.dumps({**doc.to_dict(), "id": doc.id}, default=datetime_default) + b"\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# ---------- Signup ----------
+
+async def commit_with_claims(batch, uid: str, claims: dict):
+    """Grant Firebase Auth claims, then commit the Firestore batch, so neither lands without the other.
+
+    A failed claims call (e.g. an unknown uid) writes nothing; a failed commit clears the claims again.
+    Only called at signup, when the user has no prior claims to restore.
+    """
+    await asyncio.to_thread(auth.set_custom_user_claims, uid, claims)
+    try:
+        await batch.commit()
+    except Exception:
+        await asyncio.to_thread(auth.set_custom_user_claims, uid, None)
+        raise
+
 # ---------- Routes ----------
 
 @app.post("/assign-role")
-async def assign_role(data: SignupRequest):
-    auth.set_custom_user_claims(data.uid, {"role": data.role})
-    
+async def assign_role(data: SignupRequest) -> MessageResponse:
     # Create user document
-    db.collection("users").document(data.uid).set({
+    batch = db.batch()
+    batch.set(db.collection("users").document(data.uid), {
         "name": data.name,
         "email": data.email,
         "role": data.role
     })
+    batch.set(users_by_email_col.document(email_key(data.email)), {"uid": data.uid})
     
     # If admin, also create admin document for onboarding system
     if data.role == "admin":
-        db.collection("admins").document(data.uid).set({
+        batch.set(db.collection("admins").document(data.uid), {
             "name": data.name,
             "email": data.email,
-            "createdAt": datetime.now()
+            "createdAt": firestore.SERVER_TIMESTAMP
         })
-        print(f"🔍 Created admin document for {data.email}")
+
+    await commit_with_claims(batch, data.uid, {"role": data.role})
+    invalidate(_admin_info_cache, lambda uid: uid == data.uid)
+    if data.role == "admin":
+        logger.info("🔍 Created admin document for %s", data.email)
     
-    return {"message": f"Role {data.role} assigned to {data.email}"}
+    return MessageResponse(message=f"Role {data.role} assigned to {data.email}")
 
 # Repositories
 
 @app.post("/repositories")
-async def create_repo(repo: CreateRepositoryRequest):
+async def create_repo(repo: CreateRepositoryRequest) -> Repository:
     repo_id = str(uuid.uuid4())
     repository = Repository(
         id=repo_id,
@@ -169,46 +494,56 @@ async def create_repo(repo: CreateRepositoryRequest):
         status="synced",
         adminUid=repo.adminUid
     )
-    db.collection("admins").document(repo.adminUid)\
-      .collection("repositories").document(repo_id)\
-      .set(repository.dict())
+    # Firestore stamps lastSync itself; the response keeps the local approximation
+    repo_data = repository.model_dump(exclude={"lastSync"})
+    repo_data["lastSync"] = firestore.SERVER_TIMESTAMP
+    await repos_col(repo.adminUid).document(repo_id).set(repo_data)
+    invalidate_repos(repo.adminUid)
     return repository
 
-@app.get("/repositories/{admin_uid}")
-async def get_repos(admin_uid: str):
-    repos = []
-    docs = db.collection("admins").document(admin_uid)\
-        .collection("repositories").stream()
-    for doc in docs:
-        data = doc.to_dict()
-        data["id"] = doc.id
-        repos.append(data)
-    return repos
+@app.get("/repositories/{admin_uid}", response_model=RepositoryPage)
+async def get_repos(request: Request, admin_uid: str, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    if wants_ndjson(request):
+        return stream_ndjson(repos_col(admin_uid).select(REPO_LIST_FIELDS).order_by("lastSync"))
+    return await cached_read(
+        _repos_page_cache, (admin_uid, limit, cursor),
+        lambda: fetch_page(repos_col(admin_uid), "lastSync", limit, cursor, REPO_LIST_FIELDS),
+    )
 
 @app.delete("/repositories/{admin_uid}/{repo_id}")
-async def delete_repository(admin_uid: str, repo_id: str):
-    ref = db.collection("admins").document(admin_uid)\
-        .collection("repositories").document(repo_id)
-    if not ref.get().exists:
+async def delete_repository(admin_uid: str, repo_id: str) -> MessageResponse:
+    ref = repos_col(admin_uid).document(repo_id)
+    try:
+        await ref.delete(option=db.write_option(exists=True))
+    except NotFound:
         raise HTTPException(status_code=404, detail="Repository not found")
-    ref.delete()
-    return {"message": "Repository deleted successfully"}
+    invalidate_repos(admin_uid)
+    return MessageResponse(message="Repository deleted successfully")
 
 # Onboarding sessions (create/list/delete, fetch by token, employee-signup)
 
-@app.post("/onboarding-sessions")
-async def create_onboarding(session: CreateOnboardingRequest):
+@app.post("/onboarding-sessions", openapi_extra=json_body_schema(CreateOnboardingRequest))
+async def create_onboarding(
+    background_tasks: BackgroundTasks,
+    session: CreateOnboardingRequest = Depends(json_body(CreateOnboardingRequest)),
+) -> OnboardingSession:
     session_id = str(uuid.uuid4())
 
-    # Optional: validate repo IDs exist
-    repos_ref = db.collection("admins").document(session.adminUid).collection("repositories")
-    existing_ids = {doc.id for doc in repos_ref.stream()}
+    # Optional: validate repo IDs exist (point lookups for anything not already cached)
     for rid in session.repositories:
-        if rid not in existing_ids:
+        if not is_doc_id(rid):
             raise HTTPException(status_code=400, detail=f"Repository '{rid}' not found for this admin")
-
-    admin_doc = db.collection("users").document(session.adminUid).get()
-    admin_name = admin_doc.to_dict().get("name", "Your Admin") if admin_doc.exists else "Your Admin"
+    known_ids = _repo_ids_cache.get(session.adminUid, frozenset())
+    unchecked = list(dict.fromkeys(rid for rid in session.repositories if rid not in known_ids))
+    if unchecked:
+        # One batched multi-get RPC for all the unchecked refs
+        repos_ref = repos_col(session.adminUid)
+        async for snap in db.get_all([repos_ref.document(rid) for rid in unchecked]):
+            if not snap.exists:
+                raise HTTPException(status_code=400, detail=f"Repository '{snap.id}' not found for this admin")
+        _repo_ids_cache[session.adminUid] = known_ids | set(unchecked)
+
+    admin_name = (await get_admin_info(session.adminUid)).get("name", "Your Admin")
 
     new_session = OnboardingSession(
         id=session_id,
@@ -223,26 +558,31 @@ async def create_onboarding(session: CreateOnboardingRequest):
         adminUid=session.adminUid
     )
 
-    # Store the session
-    session_ref = db.collection("admins").document(session.adminUid)\
-      .collection("onboarding_sessions").document(session_id)
-    session_ref.set(new_session.dict())
+    # Store the session and its token index entry together
+    session_data = new_session.model_dump(exclude={"createdAt"})
+    session_data["createdAt"] = firestore.SERVER_TIMESTAMP
+    batch = db.batch()
+    batch.set(sessions_col(session.adminUid).document(session_id), session_data)
+    batch.set(tokens_col.document(session_id), {"adminUid": session.adminUid, "sessionId": session_id})
+    await batch.commit()
+    _pending_sessions[session_id] = (session.adminUid, {**session_data, "createdAt": new_session.createdAt})
 
     link = f"http://localhost:5173/?employee-signup&token={session_id}"
-    send_onboarding_email(session.email, link, session.role, admin_name)
+    # Sent after the response goes out; sync tasks run in Starlette's threadpool
+    background_tasks.add_task(send_onboarding_email, session.email, link, session.role, admin_name)
     return new_session
 
 @app.get("/debug/admins")
-async def debug_admins():
+async def debug_admins() -> dict:
     """Debug endpoint to see what admin documents exist"""
     admins = []
-    for admin_doc in db.collection("admins").stream():
+    async for admin_doc in db.collection("admins").stream():
         admin_data = admin_doc.to_dict()
         admin_uid = admin_doc.id
         
         # Get sessions for this admin
         sessions = []
-        for session_doc in admin_doc.reference.collection("onboarding_sessions").stream():
+        async for session_doc in admin_doc.reference.collection("onboarding_sessions").stream():
             sessions.append({
                 "id": session_doc.id,
                 "data": session_doc.to_dict()
@@ -257,89 +597,128 @@ async def debug_admins():
     return {"admins": admins}
 
 @app.post("/debug/migrate-admins")
-async def migrate_admins():
+async def migrate_admins() -> dict:
     """Create admin documents for existing admin users"""
     migrated = []
     
     # Find all users with admin role
-    users = db.collection("users").where("role", "==", "admin").stream()
+    users = db.collection("users").where(filter=FieldFilter("role", "==", "admin")).select(["name", "email"]).stream()
     
-    for user_doc in users:
-        user_data = user_doc.to_dict()
-        user_uid = user_doc.id
+    user_docs = {user_doc.id: user_doc async for user_doc in users}
+    if not user_docs:
+        return {"migrated": migrated}
+
+    # Check which admin documents already exist with one multi-get instead of a probe per user
+    admin_refs = [db.collection("admins").document(uid) for uid in user_docs]
+    batch = db.batch()
+    async for admin_doc in db.get_all(admin_refs):
+        user_data = user_docs[admin_doc.id].to_dict()
+        user_uid = admin_doc.id
         
-        # Check if admin document already exists
-        admin_ref = db.collection("admins").document(user_uid)
-        if not admin_ref.get().exists:
+        if not admin_doc.exists:
             # Create admin document
-            admin_ref.set({
+            batch.set(admin_doc.reference, {
                 "name": user_data.get("name"),
                 "email": user_data.get("email"),
-                "createdAt": datetime.now()
+                "createdAt": firestore.SERVER_TIMESTAMP
             })
             migrated.append({
                 "uid": user_uid,
                 "email": user_data.get("email")
             })
+            if len(migrated) % MAX_BATCH_WRITES == 0:
+                await batch.commit()
+                batch = db.batch()
     
+    if len(migrated) % MAX_BATCH_WRITES:
+        await batch.commit()
+    return {"migrated": migrated}
+
+@app.post("/debug/migrate-onboarding-tokens")
+async def migrate_onboarding_tokens() -> dict:
+    """Backfill onboarding_tokens index entries for sessions created before the index existed"""
+    migrated = []
+
+    batch = db.batch()
+    # Only document IDs are needed, so project away every field
+    async for admin_doc in db.collection("admins").select([]).stream():
+        async for session_doc in sessions_col(admin_doc.id).select([]).stream():
+            batch.set(tokens_col.document(session_doc.id), {
+                "adminUid": admin_doc.id,
+                "sessionId": session_doc.id
+            })
+            migrated.append({
+                "token": session_doc.id,
+                "adminUid": admin_doc.id
+            })
+            if len(migrated) % MAX_BATCH_WRITES == 0:
+                await batch.commit()
+                batch = db.batch()
+
+    if len(migrated) % MAX_BATCH_WRITES:
+        await batch.commit()
     return {"migrated": migrated}
 
-@app.get("/onboarding-sessions/{admin_uid}")
-async def list_onboarding_sessions(admin_uid: str):
-    sessions = []
-    docs = db.collection("admins").document(admin_uid)\
-        .collection("onboarding_sessions").order_by("createdAt").stream()
-    for doc in docs:
-        data = doc.to_dict()
-        data["id"] = doc.id
-        sessions.append(data)
-    return sessions
+@app.get("/onboarding-sessions/{admin_uid}", response_model=OnboardingSessionPage)
+async def list_onboarding_sessions(request: Request, admin_uid: str, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    if wants_ndjson(request):
+        return stream_ndjson(sessions_col(admin_uid).select(SESSION_LIST_FIELDS).order_by("createdAt"))
+    return await fetch_page(sessions_col(admin_uid), "createdAt", limit, cursor, SESSION_LIST_FIELDS)
+
+@app.get("/onboarding-sessions/{admin_uid}/{session_id}")
+async def get_onboarding_session(admin_uid: str, session_id: str) -> dict:
+    """Full session document, including the fields the list view leaves out (customInstructions etc.)"""
+    doc = await sessions_col(admin_uid).document(session_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Onboarding session not found")
+    return {**doc.to_dict(), "id": doc.id}
 
 @app.delete("/onboarding-sessions/{admin_uid}/{session_id}")
-async def delete_onboarding_session(admin_uid: str, session_id: str):
-    ref = db.collection("admins").document(admin_uid)\
-        .collection("onboarding_sessions").document(session_id)
-    if not ref.get().exists:
+async def delete_onboarding_session(admin_uid: str, session_id: str) -> MessageResponse:
+    batch = db.batch()
+    batch.delete(sessions_col(admin_uid).document(session_id), option=db.write_option(exists=True))
+    batch.delete(tokens_col.document(session_id))
+    try:
+        await batch.commit()
+    except NotFound:
         raise HTTPException(status_code=404, detail="Onboarding session not found")
-    ref.delete()
-    return {"message": "Onboarding session deleted successfully"}
+    invalidate(_session_cache, lambda token: token == session_id)
+    _pending_sessions.pop(session_id, None)
+    return MessageResponse(message="Onboarding session deleted successfully")
 
 @app.get("/employee-onboarding/{token}")
-async def get_employee_onboarding(token: str):
-    for admin_doc in db.collection("admins").stream():
-        s_ref = admin_doc.reference.collection("onboarding_sessions").document(token)
-        s_doc = s_ref.get()
-        if s_doc.exists:
-            session = s_doc.to_dict()
-            admin_uid = admin_doc.id
-            admin_user = db.collection("users").document(admin_uid).get()
-            admin_info = admin_user.to_dict() if admin_user.exists else {}
-            return {
-                "id": token,
-                "email": session["email"],
-                "role": session["role"],
-                "repositories": session["repositories"],  # repo IDs
-                "customInstructions": session.get("customInstructions"),
-                "userLevel": session.get("userLevel", "beginner"),
-                "adminUid": admin_uid,
-                "adminName": admin_info.get("name", "Unknown Admin"),
-                "adminEmail": admin_info.get("email", "")
-            }
-    raise HTTPException(status_code=404, detail="Invalid onboarding token")
+async def get_employee_onboarding(token: str, request: Request):
+    body, etag = await cached_read(_session_cache, token, lambda: load_employee_onboarding(token))
+    # The invite payload is fixed once the session exists, so browsers may reuse it briefly
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=60"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+async def load_employee_onboarding(token: str):
+    """Encoded onboarding payload and its ETag, computed once per cache fill rather than per poll"""
+    admin_uid, _, session = await find_session(token)
+    if not session:
+        raise HTTPException(status_code=404, detail="Invalid onboarding token")
+
+    admin_info = await get_admin_info(admin_uid)
+    body = orjson.dumps({
+        "id": token,
+        "email": session["email"],
+        "role": session["role"],
+        "repositories": session["repositories"],  # repo IDs
+        "customInstructions": session.get("customInstructions"),
+        "userLevel": session.get("userLevel", "beginner"),
+        "adminUid": admin_uid,
+        "adminName": admin_info.get("name", "Unknown Admin"),
+        "adminEmail": admin_info.get("email", "")
+    }, option=orjson.OPT_SORT_KEYS)
+    return body, '"%s"' % hashlib.sha1(body).hexdigest()
 
 @app.post("/employee-signup")
-async def employee_signup(data: EmployeeSignupRequest):
+async def employee_signup(data: EmployeeSignupRequest) -> EmployeeSignupResponse:
     # find session
-    session_data, admin_uid, ref = None, None, None
-    for admin_doc in db.collection("admins").stream():
-        tmp_ref = admin_doc.reference.collection("onboarding_sessions").document(data.onboarding_token)
-        tmp_doc = tmp_ref.get()
-        if tmp_doc.exists:
-            session_data = tmp_doc.to_dict()
-            admin_uid = admin_doc.id
-            ref = tmp_ref
-            break
-
+    admin_uid, ref, session_data = await find_session(data.onboarding_token)
     if not session_data:
         raise HTTPException(status_code=404, detail="Invalid token")
 
@@ -347,27 +726,36 @@ async def employee_signup(data: EmployeeSignupRequest):
         raise HTTPException(status_code=400, detail="Email mismatch")
 
     role = session_data["role"]
-    auth.set_custom_user_claims(data.uid, {"role": "employee", "job_role": role})
-
-    db.collection("users").document(data.uid).set({
+    # User doc and session status are committed atomically in one RPC
+    batch = db.batch()
+    batch.set(db.collection("users").document(data.uid), {
         "name": data.name,
         "email": data.email,
         "role": "employee",
         "job_role": role,
         "invitedBy": admin_uid,
         "onboardingSessionId": data.onboarding_token,
-        "signupDate": datetime.now()
+        "signupDate": firestore.SERVER_TIMESTAMP
     })
+    batch.set(users_by_email_col.document(email_key(data.email)), {"uid": data.uid})
+    batch.update(ref, {"status": "in_progress", "employeeUid": data.uid, "startedAt": firestore.SERVER_TIMESTAMP})
 
-    ref.update({"status": "in_progress", "employeeUid": data.uid, "startedAt": datetime.now()})
-
-    return {
-        "message": "Employee signup complete",
-        "session": {
-            "id": data.onboarding_token,
-            "role": role,
-            "repositories": session_data["repositories"],
-            "customInstructions": session_data.get("customInstructions"),
-            "userLevel": session_data.get("userLevel", "beginner"),
-        }
-    }
\ No newline at end of file
+    try:
+        await commit_with_claims(batch, data.uid, {"role": "employee", "job_role": role})
+    except NotFound:
+        # Session was deleted after it was read (or while it sat in the pending cache)
+        raise HTTPException(status_code=404, detail="Invalid token")
+    finally:
+        invalidate(_session_cache, lambda token: token == data.onboarding_token)
+        _pending_sessions.pop(data.onboarding_token, None)
+
+    return EmployeeSignupResponse(
+        message="Employee signup complete",
+        session=SignupSession(
+            id=data.onboarding_token,
+            role=role,
+            repositories=session_data["repositories"],
+            customInstructions=session_data.get("customInstructions"),
+            userLevel=session_data.get("userLevel", "beginner"),
+        )
+    )
\ No newline at end of file
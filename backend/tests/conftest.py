@@ -0,0 +1,31 @@
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+@pytest.fixture(scope="session")
+def main():
+    """Import backend/main.py without real Firebase credentials or a Firestore connection"""
+    with mock.patch.dict(os.environ, {"FIREBASE_SA_JSON": "{}"}), \
+            mock.patch("firebase_admin.credentials.Certificate"), \
+            mock.patch("firebase_admin.initialize_app"), \
+            mock.patch("firebase_admin.firestore_async.client"):
+        import main as main_module
+    return main_module
+
+
+
+@pytest.fixture(autouse=True)
+def clear_caches(main):
+    """Each test starts with empty read caches and no in-flight fills left over from another test"""
+    caches = [main._repo_ids_cache, main._repos_page_cache, main._session_cache,
+              main._admin_info_cache, main._pending_sessions, main._inflight]
+    for cache in caches:
+        cache.clear()
+    yield
+    for cache in caches:
+        cache.clear()
@@ -0,0 +1,30 @@
+"""Minimal Firestore stand-ins shared by the backend tests"""
+
+
+class FakeDoc:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeQuery:
+    """Stands in for a Firestore collection/query: select/order_by/limit chain back to itself"""
+
+    def __init__(self, docs):
+        self._docs = docs
+
+    def select(self, fields):
+        return self
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, n):
+        return self
+
+    async def stream(self):
+        for doc in self._docs:
+            yield doc
@@ -0,0 +1,289 @@
+import asyncio
+import datetime
+import importlib.util
+import logging
+import smtplib
+from unittest import mock
+
+import orjson
+from fastapi.testclient import TestClient
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.api_core.exceptions import NotFound
+
+from fakes import FakeDoc, FakeQuery
+
+
+def test_ndjson_stream_encodes_firestore_timestamps(main, monkeypatch):
+    synced = DatetimeWithNanoseconds(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    docs = [FakeDoc("r1", {"name": "api", "lastSync": synced})]
+    monkeypatch.setattr(main, "repos_col", lambda admin_uid: FakeQuery(docs))
+
+    response = TestClient(main.app).get("/repositories/u", headers={"Accept": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    lines = [orjson.loads(line) for line in response.content.splitlines()]
+    assert lines == [{"name": "api", "lastSync": synced.isoformat(), "id": "r1"}]
+
+
+def test_repository_page_serializes_through_response_model(main, monkeypatch):
+    synced = DatetimeWithNanoseconds(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    docs = [FakeDoc("r1", {"name": "api", "url": "u", "description": "d", "language": "py",
+                           "lastSync": synced, "status": "synced", "adminUid": "page-admin"})]
+    monkeypatch.setattr(main, "repos_col", lambda admin_uid: FakeQuery(docs))
+
+    response = TestClient(main.app).get("/repositories/page-admin", params={"limit": 5})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "items": [{"id": "r1", "name": "api", "url": "u", "description": "d", "language": "py",
+                   "lastSync": "2024-05-01T12:30:00Z", "status": "synced"}],
+        "next_cursor": None,
+    }
+
+
+def test_create_onboarding_rejects_malformed_repo_ids(main):
+    client = TestClient(main.app)
+    for rid in ["a/b", ""]:
+        response = client.post("/onboarding-sessions", json={
+            "email": "new@example.com",
+            "role": "Backend Engineer",
+            "repositories": [rid],
+            "adminUid": "admin",
+        })
+        assert response.status_code == 400
+        assert response.json()["detail"] == f"Repository '{rid}' not found for this admin"
+
+
+def test_create_onboarding_documents_request_body(main):
+    body = main.app.openapi()["paths"]["/onboarding-sessions"]["post"]["requestBody"]
+    schema = body["content"]["application/json"]["schema"]
+    assert body["required"] is True
+    assert set(schema["required"]) == {"email", "role", "repositories", "adminUid"}
+
+
+def test_responses_without_origin_vary_on_origin(main, monkeypatch):
+    monkeypatch.setattr(main, "repos_col", lambda admin_uid: FakeQuery([]))
+
+    response = TestClient(main.app).get("/repositories/u", headers={"Accept": "application/x-ndjson"})
+
+    assert "Origin" in response.headers["vary"]
+
+
+def test_list_rejects_malformed_cursor(main):
+    response = TestClient(main.app).get("/onboarding-sessions/u", params={"cursor": "a/b"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_employee_signup_404s_when_cached_session_was_deleted(main, monkeypatch):
+    main._pending_sessions["tok"] = ("admin", {"email": "new@example.com", "role": "Backend Engineer", "repositories": []})
+    batch = mock.MagicMock()
+    batch.commit = mock.AsyncMock(side_effect=NotFound("session deleted"))
+    monkeypatch.setattr(main.db, "batch", lambda: batch)
+    monkeypatch.setattr(main.auth, "set_custom_user_claims", lambda uid, claims: None)
+
+    response = TestClient(main.app).post("/employee-signup", json={
+        "uid": "u1",
+        "name": "New Hire",
+        "email": "new@example.com",
+        "onboarding_token": "tok",
+    })
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Invalid token"
+    assert "tok" not in main._pending_sessions
+
+
+def test_employee_onboarding_encodes_once_and_revalidates_with_etag(main, monkeypatch):
+    main._pending_sessions["etag-tok"] = ("admin", {"email": "new@example.com", "role": "Designer", "repositories": ["r1"]})
+    main._admin_info_cache["admin"] = {"name": "Ada", "email": "ada@example.com"}
+    dumps = mock.Mock(wraps=orjson.dumps)
+    monkeypatch.setattr(main.orjson, "dumps", dumps)
+    client = TestClient(main.app)
+
+    first = client.get("/employee-onboarding/etag-tok")
+    again = client.get("/employee-onboarding/etag-tok", headers={"If-None-Match": first.headers["etag"]})
+
+    assert first.status_code == 200
+    assert first.json()["adminName"] == "Ada"
+    assert again.status_code == 304
+    assert again.headers["etag"] == first.headers["etag"]
+    assert dumps.call_count == 1
+
+
+def _signup_body():
+    return {"uid": "u1", "name": "New Hire", "email": "new@example.com", "role": "admin"}
+
+
+def test_assign_role_writes_nothing_when_claims_fail(main, monkeypatch):
+    batch = mock.MagicMock()
+    batch.commit = mock.AsyncMock()
+    monkeypatch.setattr(main.db, "batch", lambda: batch)
+
+    def reject(uid, claims):
+        raise main.auth.UserNotFoundError("no user")
+    monkeypatch.setattr(main.auth, "set_custom_user_claims", reject)
+
+    response = TestClient(main.app, raise_server_exceptions=False).post("/assign-role", json=_signup_body())
+
+    assert response.status_code == 500
+    batch.commit.assert_not_awaited()
+
+
+def test_assign_role_clears_claims_when_commit_fails(main, monkeypatch):
+    batch = mock.MagicMock()
+    batch.commit = mock.AsyncMock(side_effect=RuntimeError("commit failed"))
+    monkeypatch.setattr(main.db, "batch", lambda: batch)
+    set_claims = mock.Mock()
+    monkeypatch.setattr(main.auth, "set_custom_user_claims", set_claims)
+
+    response = TestClient(main.app, raise_server_exceptions=False).post("/assign-role", json=_signup_body())
+
+    assert response.status_code == 500
+    assert set_claims.call_args_list == [mock.call("u1", {"role": "admin"}), mock.call("u1", None)]
+
+
+def test_cached_read_coalesces_concurrent_misses(main):
+    cache = {}
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "page"
+
+    async def scenario():
+        return await asyncio.gather(*[main.cached_read(cache, "k", fetch) for _ in range(5)])
+
+    assert asyncio.run(scenario()) == ["page"] * 5
+    assert len(calls) == 1
+    assert cache == {"k": "page"}
+    assert main._inflight == {}
+
+
+def test_invalidate_detaches_in_flight_fill(main):
+    cache = {}
+    release = None
+    fetched = []
+
+    async def stale_fetch():
+        await release.wait()
+        fetched.append("stale")
+        return "stale"
+
+    async def fresh_fetch():
+        fetched.append("fresh")
+        return "fresh"
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        before = asyncio.ensure_future(main.cached_read(cache, ("admin", 50, None), stale_fetch))
+        await asyncio.sleep(0)
+        main.invalidate(cache, lambda key: key[0] == "admin")
+        # A request after the write must not join the pre-write fetch
+        after = await main.cached_read(cache, ("admin", 50, None), fresh_fetch)
+        release.set()
+        return await before, after
+
+    assert asyncio.run(scenario()) == ("stale", "fresh")
+    assert fetched == ["fresh", "stale"]
+    assert cache == {("admin", 50, None): "fresh"}
+    assert main._inflight == {}
+
+
+def test_malformed_onboarding_tokens_are_invalid(main):
+    client = TestClient(main.app)
+    for token in ["a/b", ""]:
+        response = client.post("/employee-signup", json={
+            "uid": "u1",
+            "name": "New Hire",
+            "email": "new@example.com",
+            "onboarding_token": token,
+        })
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Invalid token"
+
+
+def test_lowercase_log_level_configures_only_the_app_logger(main, monkeypatch):
+    root_level = logging.getLogger().level
+    app_level = main.logger.level
+    monkeypatch.setenv("LOG_LEVEL", "debug")
+    monkeypatch.setenv("FIREBASE_SA_JSON", "{}")
+    spec = importlib.util.spec_from_file_location("main_debug", main.__file__)
+    with mock.patch("firebase_admin.credentials.Certificate"), \
+            mock.patch("firebase_admin.initialize_app"), \
+            mock.patch("firebase_admin.firestore_async.client"):
+        spec.loader.exec_module(importlib.util.module_from_spec(spec))
+
+    try:
+        assert main.logger.level == logging.DEBUG
+        assert logging.getLogger().level == root_level
+    finally:
+        main.logger.setLevel(app_level)
+
+
+def test_lifespan_warms_firestore_and_survives_failure(main, monkeypatch):
+    doc = mock.MagicMock()
+    doc.get = mock.AsyncMock(side_effect=RuntimeError("unavailable"))
+    col = mock.MagicMock()
+    col.document.return_value = doc
+    monkeypatch.setattr(main.db, "collection", lambda name: col)
+
+    with TestClient(main.app):
+        pass
+
+    doc.get.assert_awaited_once()
+
+
+def smtp_connections(count):
+    connections = [mock.MagicMock(name=f"smtp{i}") for i in range(count)]
+    for server in connections:
+        server.noop.return_value = (250, b"OK")
+    return connections
+
+
+def test_smtp_pool_reuses_connection_until_idle_expiry(main):
+    first, second = smtp_connections(2)
+    pool = main.SMTPPool(max_idle=100)
+    with mock.patch.object(main.smtplib, "SMTP", side_effect=[first, second]) as smtp:
+        pool.send("a@example.com", "one")
+        pool.send("a@example.com", "two")
+        assert smtp.call_count == 1
+
+        pool._last_used -= 101
+        pool.send("a@example.com", "three")
+
+    assert smtp.call_count == 2
+    first.quit.assert_called_once()
+    assert first.sendmail.call_count == 2
+    second.sendmail.assert_called_once_with(main.FROM_EMAIL, "a@example.com", "three")
+
+
+def test_smtp_pool_reconnects_when_noop_probe_fails(main):
+    first, second, third = smtp_connections(3)
+    first.noop.side_effect = smtplib.SMTPServerDisconnected("gone")
+    second.noop.return_value = (421, b"closing")
+    pool = main.SMTPPool()
+    with mock.patch.object(main.smtplib, "SMTP", side_effect=[first, second, third]) as smtp:
+        pool.send("a@example.com", "one")
+        pool.send("a@example.com", "two")
+        pool.send("a@example.com", "three")
+
+    assert smtp.call_count == 3
+    first.quit.assert_called_once()
+    second.quit.assert_called_once()
+    third.sendmail.assert_called_once_with(main.FROM_EMAIL, "a@example.com", "three")
+
+
+def test_smtp_pool_retries_once_after_disconnect_during_send(main):
+    first, second = smtp_connections(2)
+    first.sendmail.side_effect = smtplib.SMTPServerDisconnected("dropped")
+    pool = main.SMTPPool()
+    with mock.patch.object(main.smtplib, "SMTP", side_effect=[first, second]) as smtp:
+        pool.send("a@example.com", "hello")
+
+    assert smtp.call_count == 2
+    second.login.assert_called_once_with(main.EMAIL_USER, main.EMAIL_PASSWORD)
+    second.sendmail.assert_called_once_with(main.FROM_EMAIL, "a@example.com", "hello")
@@ -116,19 +116,31 @@ export default function AdminDashboard({ user }: AdminDashboardProps) {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
-  const loadRepositories = async () => {
-    try {
-      console.log("🔄 Loading repositories for user:", user.uid);
-      const response = await fetch(`http://localhost:8001/repositories/${user.uid}`);
-      console.log("📡 Repository response status:", response.status);
-      
+  // List endpoints are paginated; follow next_cursor until every page is loaded
+  const fetchAllPages = async (url: string) => {
+    const items: any[] = [];
+    let cursor: string | null = null;
+    do {
+      const response: Response = await fetch(cursor ? `${url}?cursor=${encodeURIComponent(cursor)}` : url);
+      console.log("📡 Response status:", url, response.status);
+
       if (!response.ok) {
         const errorText = await response.text();
-        console.error("❌ Repository fetch failed:", errorText);
-        throw new Error(`Failed to fetch repos: ${response.status}`);
+        console.error("❌ Fetch failed:", errorText);
+        throw new Error(`Failed to fetch ${url}: ${response.status}`);
       }
-      
-      const data = await response.json();
+
+      const page = await response.json();
+      items.push(...page.items);
+      cursor = page.next_cursor;
+    } while (cursor);
+    return items;
+  };
+
+  const loadRepositories = async () => {
+    try {
+      console.log("🔄 Loading repositories for user:", user.uid);
+      const data = await fetchAllPages(`http://localhost:8001/repositories/${user.uid}`);
       console.log("📦 Repository data received:", data);
       
       const repos = data.map((repo: any) => ({
@@ -146,16 +158,7 @@ export default function AdminDashboard({ user }: AdminDashboardProps) {
   const loadOnboardingSessions = async () => {
     try {
       console.log("🔄 Loading onboarding sessions for user:", user.uid);
-      const response = await fetch(`http://localhost:8001/onboarding-sessions/${user.uid}`);
-      console.log("📡 Onboarding response status:", response.status);
-      
-      if (!response.ok) {
-        const errorText = await response.text();
-        console.error("❌ Onboarding fetch failed:", errorText);
-        throw new Error(`Failed to fetch sessions: ${response.status}`);
-      }
-      
-      const data = await response.json();
+      const data = await fetchAllPages(`http://localhost:8001/onboarding-sessions/${user.uid}`);
       console.log("📦 Onboarding data received:", data);
       
       const sessions = data.map((s: any) => ({